@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.contrib import messages
 from django.utils.html import format_html
-from django.utils import timezone
-from django.db import transaction
+from django.db.models import Prefetch
+from django.contrib.auth.models import User
 from .models import DeviceToken, PushNotification, NotificationLog
-from .firebase_service import FirebaseService
+from .signals import get_target_token_rows, send_to_token_rows
 import json
 
 
@@ -15,6 +15,16 @@ class DeviceTokenAdmin(admin.ModelAdmin):
     search_fields = ['token', 'user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at']
     
+    def get_search_results(self, request, queryset, search_term):
+        # A pasted full token is found through the unique token_hash index
+        # instead of a substring scan over every token
+        term = search_term.strip()
+        if term:
+            exact = queryset.filter(token_hash=DeviceToken.hash_token(term))
+            if exact.exists():
+                return exact, False
+        return super().get_search_results(request, queryset, search_term)
+    
     def token_preview(self, obj):
         return f"{obj.token[:20]}..." if obj.token else ""
     token_preview.short_description = "Token Preview"
@@ -65,13 +75,26 @@ class PushNotificationAdmin(admin.ModelAdmin):
         sent_count = 0
         error_count = 0
         
-        for notification in queryset.filter(status='draft'):
+        drafts = queryset.filter(status='draft').prefetch_related(
+            Prefetch('target_users', queryset=User.objects.only('id'))
+        )
+        
+        for notification in drafts:
+            # Claim the draft so a concurrent send of the same notification skips it
+            claimed = PushNotification.objects.filter(
+                pk=notification.pk, status='draft'
+            ).update(status='sending')
+            
+            if not claimed:
+                continue
+            
+            # No transaction around the send: FCM calls can take minutes
             try:
-                with transaction.atomic():
-                    self._send_single_notification(notification, request)
-                    sent_count += 1
+                self._send_single_notification(notification, request)
+                sent_count += 1
             except Exception as e:
                 error_count += 1
+                PushNotification.objects.filter(pk=notification.pk).update(status='failed')
                 messages.error(
                     request,
                     f"Failed to send notification '{notification.title}': {str(e)}"
@@ -93,88 +116,39 @@ class PushNotificationAdmin(admin.ModelAdmin):
     
     def _send_single_notification(self, notification, request):
         """Send a single notification"""
-        # Update status to sending
-        notification.status = 'sending'
-        notification.save()
-        
         # Get target device tokens
-        target_tokens = self._get_target_tokens(notification)
+        token_rows, total_recipients = get_target_token_rows(notification)
         
-        if not target_tokens:
-            notification.status = 'failed'
-            notification.save()
+        if not total_recipients:
             raise Exception("No valid device tokens found for targeting criteria")
         
-        notification.total_recipients = len(target_tokens)
-        notification.save()
-        
-        # Prepare notification data
-        data = notification.data if notification.data else {}
-        
-        # Send notifications
-        success_count = 0
-        failure_count = 0
-        
-        # Send in batches of 500 (FCM limit)
-        batch_size = 500
-        for i in range(0, len(target_tokens), batch_size):
-            batch_tokens = target_tokens[i:i + batch_size]
-            
-            response = FirebaseService.send_notification_to_multiple_tokens(
-                tokens=[token.token for token in batch_tokens],
-                title=notification.title,
-                body=notification.body,
-                data=data,
-                image_url=notification.image_url
-            )
-            
-            # Log individual responses
-            for idx, resp in enumerate(response['responses']):
-                token = batch_tokens[idx]
-                
-                NotificationLog.objects.create(
-                    notification=notification,
-                    device_token=token,
-                    status='success' if resp['success'] else 'failed',
-                    error_message=resp['error'] if not resp['success'] else None
-                )
-                
-                if resp['success']:
-                    success_count += 1
-                else:
-                    failure_count += 1
-        
-        # Update notification status
-        notification.successful_sends = success_count
-        notification.failed_sends = failure_count
-        notification.sent_at = timezone.now()
-        
-        if success_count > 0:
-            notification.status = 'sent'
-        else:
-            notification.status = 'failed'
+        PushNotification.objects.filter(pk=notification.pk).update(
+            total_recipients=total_recipients
+        )
         
-        notification.save()
+        success_count, failure_count = send_to_token_rows(notification, token_rows)
         
         messages.success(
             request,
             f"Notification '{notification.title}' sent successfully! "
             f"Success: {success_count}, Failed: {failure_count}"
         )
+
+
+class RecentNotificationFilter(admin.SimpleListFilter):
+    """Filter logs by one of the most recent notifications"""
+    title = 'notification'
+    parameter_name = 'notification_id'
     
-    def _get_target_tokens(self, notification):
-        """Get device tokens based on targeting criteria"""
-        queryset = DeviceToken.objects.filter(is_active=True)
-        
-        # Filter by device type
-        if notification.target_device_types != 'all':
-            queryset = queryset.filter(device_type=notification.target_device_types)
-        
-        # Filter by users
-        if not notification.send_to_all and notification.target_users.exists():
-            queryset = queryset.filter(user__in=notification.target_users.all())
-        
-        return list(queryset)
+    def lookups(self, request, model_admin):
+        recent = PushNotification.objects.order_by('-created_at').values_list('id', 'title')[:20]
+        return [(str(pk), title) for pk, title in recent]
+    
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(notification_id=value)
+        return queryset
 
 
 @admin.register(NotificationLog)
@@ -183,7 +157,10 @@ class NotificationLogAdmin(admin.ModelAdmin):
         'id', 'notification', 'device_token_preview', 
         'status', 'sent_at', 'error_preview'
     ]
-    list_filter = ['status', 'sent_at', 'notification__title']
+    list_filter = ['status', 'sent_at', RecentNotificationFilter]
+    list_select_related = ['notification', 'device_token']
+    list_per_page = 50
+    show_full_result_count = False  # Skip the unfiltered COUNT(*) on every page
     search_fields = [
         'notification__title', 'device_token__token', 
         'error_message'
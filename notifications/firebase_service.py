@@ -1,7 +1,10 @@
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import _http_client, credentials, exceptions, messaging
+from requests.adapters import HTTPAdapter
+from .tasks import enqueue
 import json
 import os
+import threading
 from django.conf import settings
 from typing import List, Dict, Any, Optional
 import logging
@@ -9,40 +12,141 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# Firebase app shared by the whole process, set once by _initialize()
+_APP = None
+# None until initialization has run, then whether Firebase can be used
+_FIREBASE_READY = None
+_INIT_LOCK = threading.Lock()
+_TOKEN_LOCK = threading.Lock()
+
+# Error reported for sends attempted while Firebase is not configured
+NOT_CONFIGURED_ERROR = 'Firebase is not properly configured. Please check your service account key.'
+
+
+def _initialize():
+    """Initialize Firebase Admin SDK once per process"""
+    global _APP, _FIREBASE_READY
+    
+    with _INIT_LOCK:
+        if _FIREBASE_READY is not None:
+            return
+        
+        try:
+            # Path to your Firebase service account key file
+            service_account_path = getattr(settings, 'FIREBASE_SERVICE_ACCOUNT_KEY', None)
+            
+            if service_account_path and os.path.exists(service_account_path):
+                cred = credentials.Certificate(service_account_path)
+                _APP = firebase_admin.initialize_app(cred)
+                _FIREBASE_READY = True
+                logger.info("Firebase initialized successfully with service account key")
+                
+                _configure_http_pool()
+            else:
+                logger.error("Firebase service account key not found at: %s", service_account_path)
+                logger.error("Firebase features will be disabled")
+                _FIREBASE_READY = False  # Mark as failed to avoid repeated attempts
+                
+        except Exception as e:
+            logger.error("Failed to initialize Firebase: %s", e)
+            _FIREBASE_READY = False  # Mark as failed to avoid repeated attempts
+            raise e
+    
+    if _FIREBASE_READY:
+        # Fetch the OAuth2 access token before the first send, on the worker
+        # pool so neither the lock nor the caller waits on the network
+        enqueue(_ensure_access_token)
+
+
+def _configure_http_pool():
+    """
+    Widen the keep-alive connection pool of the SDK's FCM session
+    
+    The SDK mounts a default adapter holding at most 10 connections, so a
+    multicast batch opens and discards a new TLS connection for every
+    request beyond that. A larger pool keeps them alive between sends.
+    """
+    try:
+        session = messaging._get_messaging_service(_APP)._client.session
+        pool_size = getattr(settings, 'FIREBASE_HTTP_POOL_SIZE', 50)
+        session.mount('https://', HTTPAdapter(
+            pool_maxsize=pool_size,
+            max_retries=_http_client.DEFAULT_RETRY_CONFIG
+        ))
+    except Exception as e:
+        logger.warning("Could not configure Firebase HTTP connection pool: %s", e)
+
+
+def _ensure_access_token():
+    """
+    Refresh the cached OAuth2 access token once it is close to expiry
+    
+    The SDK reuses the token across sends, but every thread of a multicast
+    batch would refresh it on its own when it expires. Refreshing here
+    under a lock means one token request per expiry.
+    """
+    if _APP is None:
+        return
+    
+    credential = _APP.credential.get_credential()
+    if not credential.valid:
+        with _TOKEN_LOCK:
+            if not credential.valid:
+                _APP.credential.get_access_token()
+
+
+def _is_token_argument_error(error):
+    """Check if an INVALID_ARGUMENT error from FCM blames the registration token"""
+    try:
+        details = error.http_response.json()['error'].get('details', [])
+    except Exception:
+        details = []
+    
+    for detail in details:
+        for violation in detail.get('fieldViolations', []):
+            if violation.get('field') == 'message.token':
+                return True
+    
+    return 'registration token' in str(error).lower()
+
+
+def _build_notification(title, body, image_url):
+    """Build the FCM notification payload, once per send call"""
+    return messaging.Notification(
+        title=title,
+        body=body,
+        image=image_url
+    )
+
+
 class FirebaseService:
     """Service class to handle Firebase push notifications"""
     
-    _app = None
-    _initialized = False
-    
     @classmethod
     def initialize_firebase(cls):
         """Initialize Firebase Admin SDK"""
-        if cls._app is None and not cls._initialized:
-            try:
-                # Path to your Firebase service account key file
-                service_account_path = getattr(settings, 'FIREBASE_SERVICE_ACCOUNT_KEY', None)
-                
-                if service_account_path and os.path.exists(service_account_path):
-                    cred = credentials.Certificate(service_account_path)
-                    cls._app = firebase_admin.initialize_app(cred)
-                    cls._initialized = True
-                    logger.info("Firebase initialized successfully with service account key")
-                else:
-                    logger.error(f"Firebase service account key not found at: {service_account_path}")
-                    logger.error("Firebase features will be disabled")
-                    cls._initialized = True  # Mark as initialized to avoid repeated attempts
-                    
-            except Exception as e:
-                logger.error(f"Failed to initialize Firebase: {str(e)}")
-                cls._initialized = True  # Mark as initialized to avoid repeated attempts
-                raise e
+        if _FIREBASE_READY is None:
+            _initialize()
     
     @classmethod
     def is_firebase_available(cls):
-        """Check if Firebase is properly initialized"""
-        cls.initialize_firebase()
-        return cls._app is not None
+        """Check if Firebase is properly initialized (decided once per process)"""
+        if _FIREBASE_READY is None:
+            _initialize()
+        return _FIREBASE_READY
+    
+    @staticmethod
+    def _is_invalid_token_error(error) -> bool:
+        """Check if an FCM error means the token can never be delivered to"""
+        if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+            return True
+        
+        # INVALID_ARGUMENT is also returned for a bad message (oversized
+        # payload, bad image URL), which says nothing about the token
+        if isinstance(error, exceptions.InvalidArgumentError):
+            return _is_token_argument_error(error)
+        
+        return False
     
     @classmethod
     def send_notification_to_token(
@@ -64,23 +168,21 @@ class FirebaseService:
             image_url: Optional image URL
             
         Returns:
-            Dict with success status and message_id or error
+            Dict with success status, message_id or error, and whether
+            the token was rejected as invalid
         """
         if not cls.is_firebase_available():
             logger.error("Firebase is not available. Cannot send notification.")
             return {
                 'success': False,
                 'message_id': None,
-                'error': 'Firebase is not properly configured. Please check your service account key.'
+                'error': NOT_CONFIGURED_ERROR,
+                'invalid_token': False
             }
         
         try:
             # Create notification
-            notification = messaging.Notification(
-                title=title,
-                body=body,
-                image=image_url
-            )
+            notification = _build_notification(title, body, image_url)
             
             # Create message
             message = messaging.Message(
@@ -90,21 +192,24 @@ class FirebaseService:
             )
             
             # Send message
+            _ensure_access_token()
             response = messaging.send(message)
-            logger.info(f"Successfully sent message: {response}")
+            logger.info("Successfully sent message: %s", response)
             
             return {
                 'success': True,
                 'message_id': response,
-                'error': None
+                'error': None,
+                'invalid_token': False
             }
             
         except Exception as e:
-            logger.error(f"Failed to send notification to token {token}: {str(e)}")
+            logger.error("Failed to send notification to token %s: %s", token, e)
             return {
                 'success': False,
                 'message_id': None,
-                'error': str(e)
+                'error': str(e),
+                'invalid_token': cls._is_invalid_token_error(e)
             }
     
     @classmethod
@@ -120,7 +225,7 @@ class FirebaseService:
         Send a push notification to multiple device tokens
         
         Args:
-            tokens: List of FCM device tokens
+            tokens: List of FCM device tokens (at most 500 per call)
             title: Notification title
             body: Notification body
             data: Additional data payload
@@ -129,8 +234,6 @@ class FirebaseService:
         Returns:
             Dict with success/failure counts and details
         """
-        cls.initialize_firebase()
-        
         if not tokens:
             return {
                 'success_count': 0,
@@ -138,71 +241,81 @@ class FirebaseService:
                 'responses': []
             }
         
-        try:
-            # Create notification
-            notification = messaging.Notification(
-                title=title,
-                body=body,
-                image=image_url
-            )
-            
-            # Send to each token individually (more compatible approach)
-            responses = []
-            success_count = 0
-            failure_count = 0
-            
-            for token in tokens:
-                try:
-                    # Create individual message
-                    message = messaging.Message(
-                        notification=notification,
-                        data=data or {},
-                        token=token,
-                    )
-                    
-                    # Send individual message
-                    message_id = messaging.send(message)
-                    
-                    responses.append({
-                        'token': token,
-                        'success': True,
-                        'message_id': message_id,
-                        'error': None
-                    })
-                    success_count += 1
-                    
-                except Exception as e:
-                    responses.append({
-                        'token': token,
-                        'success': False,
-                        'message_id': None,
-                        'error': str(e)
-                    })
-                    failure_count += 1
-            
-            logger.info(f"Successfully sent {success_count} messages")
-            logger.info(f"Failed to send {failure_count} messages")
-            
+        if not cls.is_firebase_available():
+            logger.error("Firebase is not available. Cannot send notification.")
+            return cls._build_multicast_failure(tokens, NOT_CONFIGURED_ERROR)
+        
+        # A single token is sent directly, without a multicast batch
+        if len(tokens) == 1:
+            result = cls.send_notification_to_token(tokens[0], title, body, data, image_url)
             return {
-                'success_count': success_count,
-                'failure_count': failure_count,
-                'responses': responses
+                'success_count': int(result['success']),
+                'failure_count': int(not result['success']),
+                'responses': [{'token': tokens[0], **result}]
             }
+        
+        try:
+            multicast = cls._build_multicast_message(tokens, title, body, data, image_url)
+            _ensure_access_token()
+            batch_response = messaging.send_each_for_multicast(multicast)
+            return cls._build_multicast_result(tokens, batch_response)
             
         except Exception as e:
-            logger.error(f"Failed to send multicast notification: {str(e)}")
-            return {
-                'success_count': 0,
-                'failure_count': len(tokens),
-                'responses': [
-                    {
-                        'token': token,
-                        'success': False,
-                        'message_id': None,
-                        'error': str(e)
-                    } for token in tokens
-                ]
-            }
+            logger.error("Failed to send multicast notification: %s", e)
+            return cls._build_multicast_failure(tokens, e)
+    
+    @staticmethod
+    def _build_multicast_message(tokens, title, body, data, image_url):
+        """Build one multicast message for a batch of tokens (FCM accepts up to 500)"""
+        notification = _build_notification(title, body, image_url)
+        
+        return messaging.MulticastMessage(
+            notification=notification,
+            data=data or {},
+            tokens=tokens,
+        )
+    
+    @classmethod
+    def _build_multicast_result(cls, tokens, batch_response):
+        """Convert an FCM BatchResponse into per-token result dicts"""
+        # Responses are returned in the same order as the tokens
+        responses = []
+        for token, send_response in zip(tokens, batch_response.responses):
+            responses.append({
+                'token': token,
+                'success': send_response.success,
+                'message_id': send_response.message_id,
+                'error': str(send_response.exception) if send_response.exception else None,
+                'invalid_token': cls._is_invalid_token_error(send_response.exception)
+            })
+        
+        success_count = batch_response.success_count
+        failure_count = batch_response.failure_count
+        
+        logger.info("Batch sent: success=%d failure=%d", success_count, failure_count)
+        
+        return {
+            'success_count': success_count,
+            'failure_count': failure_count,
+            'responses': responses
+        }
+    
+    @staticmethod
+    def _build_multicast_failure(tokens, error):
+        """Mark every token in a batch as failed with the same error"""
+        return {
+            'success_count': 0,
+            'failure_count': len(tokens),
+            'responses': [
+                {
+                    'token': token,
+                    'success': False,
+                    'message_id': None,
+                    'error': str(error),
+                    'invalid_token': False
+                } for token in tokens
+            ]
+        }
     
     @classmethod
     def send_notification_to_topic(
@@ -226,15 +339,17 @@ class FirebaseService:
         Returns:
             Dict with success status and message_id or error
         """
-        cls.initialize_firebase()
+        if not cls.is_firebase_available():
+            logger.error("Firebase is not available. Cannot send notification.")
+            return {
+                'success': False,
+                'message_id': None,
+                'error': NOT_CONFIGURED_ERROR
+            }
         
         try:
             # Create notification
-            notification = messaging.Notification(
-                title=title,
-                body=body,
-                image=image_url
-            )
+            notification = _build_notification(title, body, image_url)
             
             # Create message
             message = messaging.Message(
@@ -244,8 +359,9 @@ class FirebaseService:
             )
             
             # Send message
+            _ensure_access_token()
             response = messaging.send(message)
-            logger.info(f"Successfully sent message to topic {topic}: {response}")
+            logger.info("Successfully sent message to topic %s: %s", topic, response)
             
             return {
                 'success': True,
@@ -254,7 +370,7 @@ class FirebaseService:
             }
             
         except Exception as e:
-            logger.error(f"Failed to send notification to topic {topic}: {str(e)}")
+            logger.error("Failed to send notification to topic %s: %s", topic, e)
             return {
                 'success': False,
                 'message_id': None,
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-15 11:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_pushnotification_auto_send'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicetoken',
+            index=models.Index(fields=['is_active', 'device_type'], name='devtok_active_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicetoken',
+            index=models.Index(fields=['user', 'is_active'], name='devtok_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['notification', 'status'], name='notiflog_notif_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['-sent_at'], name='notiflog_sent_at_idx'),
+        ),
+    ]
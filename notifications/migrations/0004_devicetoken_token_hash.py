@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-15 12:05
+
+import hashlib
+from itertools import islice
+
+from django.db import migrations, models
+
+
+def populate_token_hash(apps, schema_editor):
+    DeviceToken = apps.get_model('notifications', 'DeviceToken')
+    # Streamed in chunks so large token tables are never loaded at once
+    device_tokens = DeviceToken.objects.only('id', 'token').iterator(chunk_size=2000)
+    while True:
+        batch = list(islice(device_tokens, 2000))
+        if not batch:
+            break
+        for device_token in batch:
+            device_token.token_hash = hashlib.blake2b(device_token.token.encode(), digest_size=16).digest()
+        DeviceToken.objects.bulk_update(batch, ['token_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_devicetoken_notificationlog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicetoken',
+            name='token_hash',
+            field=models.BinaryField(max_length=16, null=True),
+        ),
+        migrations.RunPython(populate_token_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='devicetoken',
+            name='token_hash',
+            field=models.BinaryField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='devicetoken',
+            name='token',
+            field=models.TextField(),
+        ),
+    ]
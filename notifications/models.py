@@ -1,3 +1,5 @@
+import hashlib
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -5,7 +7,9 @@ from django.contrib.auth.models import User
 class DeviceToken(models.Model):
     """Model to store FCM device tokens"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
-    token = models.TextField(unique=True)
+    token = models.TextField()
+    # Fixed-size digest of the token, indexed for lookups instead of the long token text
+    token_hash = models.BinaryField(max_length=16, unique=True)
     device_type = models.CharField(max_length=20, choices=[
         ('android', 'Android'),
         ('ios', 'iOS'),
@@ -18,9 +22,38 @@ class DeviceToken(models.Model):
     def __str__(self):
         return f"{self.device_type} - {self.token[:20]}..."
 
+    @staticmethod
+    def hash_token(token):
+        """Return the digest stored in token_hash for a token"""
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude=exclude)
+
+        # token_hash is not editable, so model forms skip its unique check
+        if self.token and (exclude is None or 'token' not in exclude):
+            duplicates = DeviceToken.objects.filter(token_hash=self.hash_token(self.token))
+            if self.pk is not None:
+                duplicates = duplicates.exclude(pk=self.pk)
+            if duplicates.exists():
+                raise ValidationError({
+                    'token': self.unique_error_message(DeviceToken, ('token',))
+                })
+
+    def save(self, *args, **kwargs):
+        self.token_hash = self.hash_token(self.token)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'token' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'token_hash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Device Token"
         verbose_name_plural = "Device Tokens"
+        indexes = [
+            models.Index(fields=['is_active', 'device_type'], name='devtok_active_type_idx'),
+            models.Index(fields=['user', 'is_active'], name='devtok_user_active_idx'),
+        ]
 
 
 class PushNotification(models.Model):
@@ -92,3 +125,7 @@ class NotificationLog(models.Model):
     class Meta:
         verbose_name = "Notification Log"
         verbose_name_plural = "Notification Logs"
+        indexes = [
+            models.Index(fields=['notification', 'status'], name='notiflog_notif_status_idx'),
+            models.Index(fields=['-sent_at'], name='notiflog_sent_at_idx'),
+        ]
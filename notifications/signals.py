@@ -1,14 +1,28 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import F, Prefetch
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
 from .models import PushNotification, DeviceToken, NotificationLog
 from .firebase_service import FirebaseService
+from itertools import islice
+from .tasks import enqueue
 from django.utils import timezone
+import hashlib
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Cache key holding the current generation of cached token lists
+TARGET_TOKENS_VERSION_KEY = 'push:tokens:version'
+# Marks a token hash as recently unregistered so repeat requests skip the database
+UNREGISTERED_TOKEN_KEY = 'push:tokens:unregistered:{}'
+
 
 @receiver(post_save, sender=PushNotification)
 def auto_send_notification(sender, instance, created, **kwargs):
@@ -16,96 +30,136 @@ def auto_send_notification(sender, instance, created, **kwargs):
     Automatically send push notification when it's created and auto_send is True
     """
     if created and instance.status == 'draft' and instance.auto_send:
-        # Use transaction.on_commit to ensure the notification is saved first
-        transaction.on_commit(lambda: send_notification_async(instance.id))
+        # Use transaction.on_commit to ensure the notification is saved first,
+        # then hand the send off to the worker pool so the request returns
+        transaction.on_commit(lambda: enqueue(send_notification_async, instance.id))
 
 
 def send_notification_async(notification_id):
     """
     Send notification asynchronously
+    
+    Only drafts are sent, so a notification queued twice is sent once.
     """
     try:
-        notification = PushNotification.objects.get(id=notification_id)
-        
-        # Update status to sending
-        notification.status = 'sending'
-        notification.save()
-        
-        # Get target device tokens
-        target_tokens = get_target_tokens(notification)
+        # Claim the draft before sending
+        claimed = PushNotification.objects.filter(
+            id=notification_id, status='draft'
+        ).update(status='sending')
         
-        if not target_tokens:
-            notification.status = 'failed'
-            notification.save()
-            logger.error(f"No valid device tokens found for notification {notification.id}")
+        if not claimed:
+            logger.info("Notification %s is not a draft, skipping send", notification_id)
             return
         
-        notification.total_recipients = len(target_tokens)
-        notification.save()
-        
-        # Prepare notification data
-        data = notification.data if notification.data else {}
+        notification = PushNotification.objects.prefetch_related(
+            Prefetch('target_users', queryset=User.objects.only('id'))
+        ).get(id=notification_id)
         
-        # Send notifications
-        success_count = 0
-        failure_count = 0
-        
-        # Send in batches of 500 (FCM limit)
-        batch_size = 500
-        for i in range(0, len(target_tokens), batch_size):
-            batch_tokens = target_tokens[i:i + batch_size]
-            
-            response = FirebaseService.send_notification_to_multiple_tokens(
-                tokens=[token.token for token in batch_tokens],
-                title=notification.title,
-                body=notification.body,
-                data=data,
-                image_url=notification.image_url
-            )
-            
-            # Log individual responses
-            for idx, resp in enumerate(response['responses']):
-                token = batch_tokens[idx]
-                
-                NotificationLog.objects.create(
-                    notification=notification,
-                    device_token=token,
-                    status='success' if resp['success'] else 'failed',
-                    error_message=resp['error'] if not resp['success'] else None
-                )
-                
-                if resp['success']:
-                    success_count += 1
-                else:
-                    failure_count += 1
+        # Get target device tokens
+        token_rows, total_recipients = get_target_token_rows(notification)
         
-        # Update notification status
-        notification.successful_sends = success_count
-        notification.failed_sends = failure_count
-        notification.sent_at = timezone.now()
+        if not total_recipients:
+            PushNotification.objects.filter(pk=notification.pk).update(status='failed')
+            logger.error("No valid device tokens found for notification %s", notification.id)
+            return
         
-        if success_count > 0:
-            notification.status = 'sent'
-        else:
-            notification.status = 'failed'
+        PushNotification.objects.filter(pk=notification.pk).update(
+            total_recipients=total_recipients
+        )
         
-        notification.save()
+        success_count, failure_count = send_to_token_rows(notification, token_rows)
         
         logger.info(
-            f"Notification '{notification.title}' sent automatically! "
-            f"Success: {success_count}, Failed: {failure_count}"
+            "Notification '%s' sent automatically! Success: %d, Failed: %d",
+            notification.title, success_count, failure_count
         )
         
     except Exception as e:
-        logger.error(f"Failed to send notification {notification_id}: {str(e)}")
+        logger.error("Failed to send notification %s: %s", notification_id, e)
         try:
-            notification = PushNotification.objects.get(id=notification_id)
-            notification.status = 'failed'
-            notification.save()
+            PushNotification.objects.filter(id=notification_id).update(status='failed')
         except:
             pass
 
 
+def send_to_token_rows(notification, token_rows):
+    """
+    Send a notification to (id, token) rows in FCM-sized batches
+    
+    Each batch is logged, tokens FCM rejected are deactivated and the
+    notification's counters are updated, so progress shows mid-send. The
+    notification is marked sent or failed at the end.
+    
+    Returns:
+        Tuple of (success_count, failure_count)
+    """
+    data = notification.data if notification.data else {}
+    success_count = 0
+    failure_count = 0
+    
+    # Send in batches of 500 (FCM limit)
+    batch_size = 500
+    log_batch_size = getattr(settings, 'NOTIFICATION_LOG_BULK_BATCH', 500)
+    token_rows = iter(token_rows)
+    while True:
+        batch_rows = list(islice(token_rows, batch_size))
+        if not batch_rows:
+            break
+        
+        token_ids, tokens = zip(*batch_rows)
+        
+        response = FirebaseService.send_notification_to_multiple_tokens(
+            tokens=list(tokens),
+            title=notification.title,
+            body=notification.body,
+            data=data,
+            image_url=notification.image_url
+        )
+        
+        # Log individual responses
+        logs = []
+        invalid_token_ids = []
+        batch_success = 0
+        batch_failure = 0
+        for token_id, resp in zip(token_ids, response['responses']):
+            logs.append(NotificationLog(
+                notification=notification,
+                device_token_id=token_id,
+                status='success' if resp['success'] else 'failed',
+                error_message=resp['error'] if not resp['success'] else None
+            ))
+            
+            if resp['success']:
+                batch_success += 1
+            else:
+                batch_failure += 1
+                if resp['invalid_token']:
+                    invalid_token_ids.append(token_id)
+        
+        NotificationLog.objects.bulk_create(logs, batch_size=log_batch_size)
+        
+        # Deactivate tokens FCM reported as unregistered or invalid
+        if invalid_token_ids:
+            DeviceToken.objects.filter(id__in=invalid_token_ids).update(is_active=False)
+            invalidate_target_tokens_cache()
+        
+        # Add the batch to the running counters so progress shows mid-send
+        PushNotification.objects.filter(pk=notification.pk).update(
+            successful_sends=F('successful_sends') + batch_success,
+            failed_sends=F('failed_sends') + batch_failure
+        )
+        success_count += batch_success
+        failure_count += batch_failure
+    
+    # Update notification status
+    PushNotification.objects.filter(pk=notification.pk).update(
+        status='sent' if success_count > 0 else 'failed',
+        sent_at=timezone.now()
+    )
+    
+    return success_count, failure_count
+
+
 def get_target_tokens(notification):
     """Get device tokens based on targeting criteria"""
     queryset = DeviceToken.objects.filter(is_active=True)
@@ -115,7 +169,88 @@ def get_target_tokens(notification):
         queryset = queryset.filter(device_type=notification.target_device_types)
     
     # Filter by users
-    if not notification.send_to_all and notification.target_users.exists():
-        queryset = queryset.filter(user__in=notification.target_users.all())
+    if not notification.send_to_all:
+        # Served from the prefetch cache when target_users was prefetched
+        user_ids = [user.id for user in notification.target_users.all()]
+        if user_ids:
+            queryset = queryset.filter(user_id__in=user_ids)
+    
+    # Returned lazily so callers can stream the tokens in batches
+    return queryset
+
+
+def get_target_token_rows(notification):
+    """
+    Get (id, token) rows for the targeting criteria, cached between sends
+    
+    The cache key is built from the targeting criteria, so notifications
+    aimed at the same audience reuse one token list. Audiences larger than
+    NOTIFICATION_TOKEN_CACHE_MAX_ROWS are streamed from the database, as
+    are all audiences when the cache is not shared between processes.
+    
+    Returns:
+        Tuple of (rows, total_recipients)
+    """
+    if not shared_cache_available():
+        target_tokens = get_target_tokens(notification).values_list('id', 'token')
+        return target_tokens.iterator(chunk_size=500), target_tokens.count()
+    
+    user_ids = []
+    if not notification.send_to_all:
+        user_ids = sorted(user.id for user in notification.target_users.all())
+    
+    criteria = f"{notification.target_device_types}:{','.join(map(str, user_ids))}"
+    cache_key = "push:tokens:{}:{}".format(
+        _target_tokens_version(),
+        hashlib.blake2b(criteria.encode(), digest_size=16).hexdigest()
+    )
+    
+    rows = cache.get(cache_key)
+    if rows is not None:
+        return rows, len(rows)
+    
+    target_tokens = get_target_tokens(notification).values_list('id', 'token')
+    total_recipients = target_tokens.count()
+    
+    if total_recipients > getattr(settings, 'NOTIFICATION_TOKEN_CACHE_MAX_ROWS', 10000):
+        return target_tokens.iterator(chunk_size=500), total_recipients
+    
+    rows = list(target_tokens)
+    cache.set(cache_key, rows, getattr(settings, 'NOTIFICATION_TOKEN_CACHE_TIMEOUT', 3600))
+    return rows, len(rows)
+
+
+def shared_cache_available():
+    """
+    Check the default cache is shared by every process serving the app
     
-    return list(queryset)
+    Invalidations written to a local-memory cache are only seen by the
+    process that wrote them, so cached token state would go stale in the
+    other workers.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def _target_tokens_version():
+    """Current generation of the cached token lists"""
+    return cache.get_or_set(TARGET_TOKENS_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_target_tokens_cache():
+    """Drop all cached token lists by starting a new generation"""
+    cache.set(TARGET_TOKENS_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def unregistered_token_key(token_hash):
+    """Cache key marking the token with this hash as unregistered"""
+    return UNREGISTERED_TOKEN_KEY.format(bytes(token_hash).hex())
+
+
+@receiver([post_save, post_delete], sender=DeviceToken)
+def device_token_changed(sender, instance, **kwargs):
+    """
+    Invalidate cached token lists when a device token is saved or deleted
+    """
+    invalidate_target_tokens_cache()
+    if instance.token_hash:
+        cache.delete(unregistered_token_key(instance.token_hash))
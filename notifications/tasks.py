@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Worker pool for sends that should not block the request thread
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'NOTIFICATION_SEND_WORKERS', 4),
+    thread_name_prefix='notifications'
+)
+
+
+def _run(func, *args, **kwargs):
+    """Run a queued job with fresh database connections"""
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        logger.error("Background job %s failed: %s", func.__name__, e)
+    finally:
+        close_old_connections()
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Queue a function to run on the background worker pool
+
+    Returns:
+        Future for the queued job
+    """
+    return _executor.submit(_run, func, *args, **kwargs)
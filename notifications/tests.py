@@ -1,3 +1,616 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from firebase_admin import exceptions, messaging
+import firebase_admin
+from rest_framework.renderers import JSONRenderer
+from . import firebase_service, views
+from .firebase_service import FirebaseService
+from .models import DeviceToken, NotificationLog, PushNotification
+from .renderers import ORJSONRenderer
+from .signals import get_target_token_rows, send_to_token_rows
+from unittest import mock
+import datetime
+import decimal
+import json
+import os
+import requests
+import shutil
+import tempfile
 
-# Create your tests here.
+
+def fcm_error_response(message, field):
+    """Build an FCM v1 INVALID_ARGUMENT response blaming the given field"""
+    response = requests.Response()
+    response.status_code = 400
+    response._content = json.dumps({
+        'error': {
+            'code': 400,
+            'message': message,
+            'status': 'INVALID_ARGUMENT',
+            'details': [{
+                '@type': 'type.googleapis.com/google.rpc.BadRequest',
+                'fieldViolations': [{'field': field, 'description': message}]
+            }]
+        }
+    }).encode()
+    return response
+
+
+class InvalidTokenErrorTests(TestCase):
+    """Only errors that blame the token may deactivate it"""
+
+    def test_unregistered_and_sender_mismatch_are_token_errors(self):
+        self.assertTrue(FirebaseService._is_invalid_token_error(messaging.UnregisteredError('gone')))
+        self.assertTrue(FirebaseService._is_invalid_token_error(messaging.SenderIdMismatchError('other')))
+
+    def test_invalid_argument_on_token_is_token_error(self):
+        error = exceptions.InvalidArgumentError(
+            'Request contains an invalid argument.',
+            http_response=fcm_error_response('Invalid registration token', 'message.token')
+        )
+        self.assertTrue(FirebaseService._is_invalid_token_error(error))
+
+    def test_invalid_argument_on_message_is_not_token_error(self):
+        error = exceptions.InvalidArgumentError(
+            'Request contains an invalid argument.',
+            http_response=fcm_error_response('Invalid image URL', 'message.notification.image')
+        )
+        self.assertFalse(FirebaseService._is_invalid_token_error(error))
+        self.assertFalse(FirebaseService._is_invalid_token_error(
+            exceptions.InvalidArgumentError('Message is too big')
+        ))
+
+    def test_other_errors_are_not_token_errors(self):
+        self.assertFalse(FirebaseService._is_invalid_token_error(None))
+        self.assertFalse(FirebaseService._is_invalid_token_error(exceptions.UnavailableError('down')))
+
+
+class DeviceTokenAdminTests(TestCase):
+    """The admin add form reports duplicate tokens instead of failing on save"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        DeviceToken.objects.create(token='existing-token', device_type='android')
+
+    def test_duplicate_token_is_a_form_error(self):
+        response = self.client.post('/admin/notifications/devicetoken/add/', {
+            'token': 'existing-token',
+            'device_type': 'ios',
+            'is_active': 'on'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.context['adminform'].form.errors)
+        self.assertEqual(DeviceToken.objects.count(), 1)
+
+    def test_editing_a_token_keeps_its_own_hash(self):
+        device_token = DeviceToken.objects.get()
+        response = self.client.post(f'/admin/notifications/devicetoken/{device_token.pk}/change/', {
+            'token': 'existing-token',
+            'device_type': 'web',
+            'is_active': 'on'
+        })
+        self.assertEqual(response.status_code, 302)
+        device_token.refresh_from_db()
+        self.assertEqual(device_token.device_type, 'web')
+
+
+def use_shared_cache(test):
+    """Point the default cache at a file-based cache shared between processes"""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location)
+    test.enterContext(override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location
+        }
+    }))
+
+
+class TargetTokenCacheTests(TestCase):
+    """Cached token lists must follow registrations made by any process"""
+
+    def setUp(self):
+        DeviceToken.objects.create(token='a' * 40, device_type='android')
+        self.notification = PushNotification.objects.create(
+            title='Title',
+            body='Body',
+            auto_send=False,
+            created_by=User.objects.create_user('sender')
+        )
+
+    def target_tokens(self):
+        rows, total_recipients = get_target_token_rows(self.notification)
+        return sorted(token for _, token in rows)
+
+    def test_local_memory_cache_is_not_used(self):
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+        # bulk_create sends no signal, so only an uncached read sees it
+        DeviceToken.objects.bulk_create([DeviceToken(token='b' * 40, token_hash=DeviceToken.hash_token('b' * 40))])
+        self.assertEqual(self.target_tokens(), ['a' * 40, 'b' * 40])
+
+    def test_shared_cache_is_invalidated_by_register_and_unregister(self):
+        use_shared_cache(self)
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+
+        # Served from the cache until something invalidates it
+        DeviceToken.objects.bulk_create([DeviceToken(token='b' * 40, token_hash=DeviceToken.hash_token('b' * 40))])
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+
+        response = self.client.post('/api/notifications/register/', {'token': 'c' * 40}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.target_tokens(), ['a' * 40, 'b' * 40, 'c' * 40])
+
+        response = self.client.post('/api/notifications/unregister/', {'token': 'a' * 40}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.target_tokens(), ['b' * 40, 'c' * 40])
+
+    def test_unchanged_registration_keeps_shared_cache(self):
+        use_shared_cache(self)
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+        DeviceToken.objects.bulk_create([DeviceToken(token='b' * 40, token_hash=DeviceToken.hash_token('b' * 40))])
+
+        response = self.client.post(
+            '/api/notifications/register/', {'token': 'a' * 40, 'device_type': 'android'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+
+        response = self.client.post(
+            '/api/notifications/register-bulk/',
+            {'tokens': [{'token': 'a' * 40, 'device_type': 'android'}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.target_tokens(), ['a' * 40])
+
+        response = self.client.post(
+            '/api/notifications/register/', {'token': 'a' * 40, 'device_type': 'ios'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.target_tokens(), ['a' * 40, 'b' * 40])
+
+
+class UnregisterCacheTests(TestCase):
+    """Repeat unregisters may only skip the database with a shared cache"""
+
+    token = 'u' * 40
+
+    def post(self, path):
+        return self.client.post(path, {'token': self.token}, content_type='application/json')
+
+    def test_local_memory_cache_always_updates(self):
+        DeviceToken.objects.create(token=self.token)
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+
+        # Reactivated by another process, which this one cannot observe
+        DeviceToken.objects.update(is_active=True)
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+        self.assertFalse(DeviceToken.objects.get().is_active)
+
+    def test_shared_cache_skips_repeats_until_registered_again(self):
+        use_shared_cache(self)
+        DeviceToken.objects.create(token=self.token)
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+        self.assertEqual(self.post('/api/notifications/register/').status_code, 200)
+        self.assertTrue(DeviceToken.objects.get().is_active)
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+        self.assertFalse(DeviceToken.objects.get().is_active)
+
+    def test_unknown_token_is_not_found(self):
+        response = self.post('/api/notifications/unregister/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Device token not found'})
+
+    def test_inactive_token_is_not_rewritten(self):
+        DeviceToken.objects.create(token=self.token)
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+        updated_at = DeviceToken.objects.get().updated_at
+
+        self.assertEqual(self.post('/api/notifications/unregister/').status_code, 200)
+        device_token = DeviceToken.objects.get()
+        self.assertFalse(device_token.is_active)
+        self.assertEqual(device_token.updated_at, updated_at)
+
+
+class ORJSONRendererTests(TestCase):
+    """The orjson renderer produces the same bytes as DRF's JSONRenderer"""
+
+    data = {
+        'sent_at': datetime.datetime(2025, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2025, 1, 2),
+        'amount': decimal.Decimal('1.5'),
+        'text': 'line\u2028separator',
+        'nested': {'ids': [1, 2]}
+    }
+
+    def test_compact_output_matches_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertIn(b'"2025-01-02T03:04:05Z"', ORJSONRenderer().render(self.data))
+
+    def test_requested_indent_is_honoured(self):
+        for media_type, context in [
+            ('application/json; indent=2', None),
+            ('application/json', {'indent': 4})
+        ]:
+            rendered = ORJSONRenderer().render(self.data, media_type, context)
+            self.assertIn(b'\n  "sent_at"', rendered)
+            self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(self.data)))
+
+
+class BulkRegisterTests(TestCase):
+    """Bulk registration upserts many tokens and rejects bad entries up front"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+
+    def post(self, entries):
+        return self.client.post(
+            '/api/notifications/register-bulk/',
+            {'tokens': entries},
+            content_type='application/json'
+        )
+
+    def test_duplicate_tokens_are_registered_once(self):
+        response = self.post([
+            {'token': 'd' * 40, 'device_type': 'android'},
+            {'token': 'd' * 40, 'device_type': 'ios'},
+            {'token': 'e' * 40}
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        # The later entry for a token wins
+        self.assertEqual(DeviceToken.objects.get(token='d' * 40).device_type, 'ios')
+
+    def test_existing_tokens_are_updated(self):
+        DeviceToken.objects.create(token='d' * 40, device_type='android', is_active=False)
+        response = self.post([{'token': 'd' * 40, 'device_type': 'web', 'user_id': self.user.id}])
+        self.assertEqual(response.status_code, 200)
+        device_token = DeviceToken.objects.get()
+        self.assertEqual(
+            (device_token.device_type, device_token.user_id, device_token.is_active),
+            ('web', self.user.id, True)
+        )
+
+    def test_user_ids_may_be_strings(self):
+        response = self.post([{'token': 'd' * 40, 'user_id': f'0{self.user.id}'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DeviceToken.objects.get().user_id, self.user.id)
+
+    def test_missing_users_are_reported(self):
+        response = self.post([
+            {'token': 'd' * 40, 'user_id': self.user.id},
+            {'token': 'e' * 40, 'user_id': 999}
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['user_ids'], [999])
+        self.assertFalse(DeviceToken.objects.exists())
+
+    def test_invalid_user_ids_are_rejected(self):
+        for user_id in [[1], 'abc', True, -1, 1.5, 2 ** 64]:
+            response = self.post([{'token': 'd' * 40, 'user_id': user_id}])
+            self.assertEqual(response.status_code, 400, user_id)
+        self.assertFalse(DeviceToken.objects.exists())
+
+    @override_settings(NOTIFICATION_BULK_REGISTER_MAX_TOKENS=2)
+    def test_oversized_lists_are_rejected(self):
+        response = self.post([{'token': f'{n}' * 40} for n in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DeviceToken.objects.exists())
+
+
+class AccessTokenTests(SimpleTestCase):
+    """Fetching the OAuth2 access token never blocks the caller"""
+
+    def setUp(self):
+        # Start every test with Firebase uninitialised
+        for name in ('_APP', '_FIREBASE_READY'):
+            patcher = mock.patch.object(firebase_service, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_service_account_key(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        handle, path = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as key_file:
+            json.dump({
+                'type': 'service_account',
+                'project_id': 'push-back-test',
+                'private_key_id': 'test',
+                'private_key': private_key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption()
+                ).decode(),
+                'client_email': 'test@push-back-test.iam.gserviceaccount.com',
+                'client_id': '1',
+                'token_uri': 'https://oauth2.googleapis.com/token'
+            }, key_file)
+        return path
+
+    def test_initialization_queues_the_token_prefetch(self):
+        with override_settings(FIREBASE_SERVICE_ACCOUNT_KEY=self.write_service_account_key()), \
+                mock.patch.object(firebase_service, 'enqueue') as enqueue, \
+                mock.patch('google.oauth2.service_account.Credentials.refresh') as refresh:
+            self.assertTrue(FirebaseService.is_firebase_available())
+            self.addCleanup(firebase_admin.delete_app, firebase_service._APP)
+
+        refresh.assert_not_called()
+        enqueue.assert_called_once_with(firebase_service._ensure_access_token)
+
+
+
+@mock.patch.object(firebase_service, '_FIREBASE_READY', False)
+class FirebaseNotConfiguredTests(SimpleTestCase):
+    """Every send path reports the same error when Firebase is not configured"""
+
+    def test_multiple_tokens(self):
+        result = FirebaseService.send_notification_to_multiple_tokens(['a', 'b'], 'Title', 'Body')
+        self.assertEqual((result['success_count'], result['failure_count']), (0, 2))
+        self.assertEqual(
+            {response['error'] for response in result['responses']},
+            {firebase_service.NOT_CONFIGURED_ERROR}
+        )
+        self.assertFalse(any(response['invalid_token'] for response in result['responses']))
+
+    def test_single_token_and_topic(self):
+        for result in [
+            FirebaseService.send_notification_to_multiple_tokens(['a'], 'Title', 'Body')['responses'][0],
+            FirebaseService.send_notification_to_token('a', 'Title', 'Body'),
+            FirebaseService.send_notification_to_topic('news', 'Title', 'Body')
+        ]:
+            self.assertFalse(result['success'])
+            self.assertEqual(result['error'], firebase_service.NOT_CONFIGURED_ERROR)
+
+
+def fake_multicast_send(tokens, **kwargs):
+    """Stand in for FCM: tokens starting with 'ok' succeed, 'dead' ones are unregistered"""
+    responses = [
+        {
+            'token': token,
+            'success': token.startswith('ok'),
+            'message_id': f'id-{token}' if token.startswith('ok') else None,
+            'error': None if token.startswith('ok') else 'rejected',
+            'invalid_token': token.startswith('dead')
+        } for token in tokens
+    ]
+    success_count = sum(response['success'] for response in responses)
+    return {
+        'success_count': success_count,
+        'failure_count': len(tokens) - success_count,
+        'responses': responses
+    }
+
+
+@mock.patch.object(FirebaseService, 'send_notification_to_multiple_tokens', side_effect=fake_multicast_send)
+class SendToTokenRowsTests(TestCase):
+    """The admin action and the auto-send share one batch send"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for token in ['ok-1' * 10, 'ok-2' * 10, 'dead' * 10, 'fail' * 10]:
+            DeviceToken.objects.create(token=token)
+        self.notification = PushNotification.objects.create(
+            title='Title',
+            body='Body',
+            auto_send=False,
+            created_by=self.user
+        )
+
+    def assert_sent(self):
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, 'sent')
+        self.assertEqual((self.notification.successful_sends, self.notification.failed_sends), (2, 2))
+        self.assertEqual(NotificationLog.objects.filter(status='success').count(), 2)
+        self.assertEqual(NotificationLog.objects.filter(status='failed').count(), 2)
+        # Only the token FCM blamed is deactivated
+        self.assertEqual(
+            list(DeviceToken.objects.filter(is_active=False).values_list('token', flat=True)),
+            ['dead' * 10]
+        )
+
+    def test_rows_are_sent_logged_and_counted(self, send):
+        rows = DeviceToken.objects.order_by('id').values_list('id', 'token')
+        self.assertEqual(send_to_token_rows(self.notification, rows), (2, 2))
+        self.assert_sent()
+
+    def test_admin_action_uses_the_shared_send(self, send):
+        self.client.force_login(self.user)
+        response = self.client.post('/admin/notifications/pushnotification/', {
+            'action': 'send_notifications',
+            '_selected_action': [self.notification.pk]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_sent()
+
+    def test_admin_action_reads_the_shared_cache(self, send):
+        use_shared_cache(self)
+        get_target_token_rows(self.notification)
+        # Not seen by the admin send until something invalidates the cache
+        DeviceToken.objects.bulk_create([DeviceToken(token='late' * 10, token_hash=DeviceToken.hash_token('late' * 10))])
+
+        self.client.force_login(self.user)
+        self.client.post('/admin/notifications/pushnotification/', {
+            'action': 'send_notifications',
+            '_selected_action': [self.notification.pk]
+        })
+        self.assert_sent()
+
+
+class RequestBodyTests(TestCase):
+    """Views answer malformed bodies with a JSON 400 rather than an error page"""
+
+    endpoints = [
+        '/api/notifications/register/',
+        '/api/notifications/register-bulk/',
+        '/api/notifications/unregister/',
+        '/api/notifications/test/',
+        '/api/notifications/mock-test/'
+    ]
+
+    def test_json_array_body_is_rejected(self):
+        for path in self.endpoints:
+            response = self.client.post(path, [{'token': 'a' * 40}], content_type='application/json')
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(response.json(), {'error': 'Request body must be a JSON object'})
+
+    def test_mock_rejects_non_string_fields(self):
+        for fields in [{'token': 5}, {'token': 'a' * 40, 'title': 5}, {'token': 'a' * 40, 'body': ['x']}]:
+            response = self.client.post('/api/notifications/mock-test/', fields, content_type='application/json')
+            self.assertEqual(response.status_code, 400, fields)
+            self.assertEqual(response.json(), {'error': 'Token, title and body must be strings'})
+
+    def test_mock_message_id_is_stable(self):
+        fields = {'token': 'a' * 40, 'title': 'Title', 'body': 'Body'}
+        first = self.client.post('/api/notifications/mock-test/', fields, content_type='application/json')
+        second = self.client.post('/api/notifications/mock-test/', fields, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['message_id'], second.json()['message_id'])
+
+    def test_non_string_token_is_rejected(self):
+        for path in self.endpoints[:1] + self.endpoints[2:4]:
+            response = self.client.post(path, {'token': 12345}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(response.json(), {'error': 'Invalid token format'})
+
+
+class TokenHashMigrationTests(TransactionTestCase):
+    """The token_hash backfill hashes every existing token in chunks"""
+
+    migrate_from = [('notifications', '0003_devicetoken_notificationlog_indexes')]
+    migrate_to = [('notifications', '0004_devicetoken_token_hash')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_existing_tokens_are_hashed(self):
+        apps = self.migrate(self.migrate_from)
+        OldDeviceToken = apps.get_model('notifications', 'DeviceToken')
+        OldDeviceToken.objects.bulk_create([OldDeviceToken(token=f'token-{n}') for n in range(4500)])
+
+        apps = self.migrate(self.migrate_to)
+        NewDeviceToken = apps.get_model('notifications', 'DeviceToken')
+        for token, token_hash in NewDeviceToken.objects.values_list('token', 'token_hash'):
+            self.assertEqual(bytes(token_hash), DeviceToken.hash_token(token))
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('notifications'))
+
+
+class RegisterDeviceTokenTests(TestCase):
+    """Single token registration"""
+
+    token = 'r' * 40
+
+    def post(self, **fields):
+        return self.client.post(
+            '/api/notifications/register/',
+            {'token': self.token, **fields},
+            content_type='application/json'
+        )
+
+    def test_new_token_is_created(self):
+        response = self.post(device_type='ios')
+        self.assertEqual(response.status_code, 201)
+        device_token = DeviceToken.objects.get()
+        self.assertEqual(
+            response.json(),
+            {
+                'message': 'Device token registered successfully',
+                'created': True,
+                'device_token_id': device_token.id
+            }
+        )
+        self.assertEqual(device_token.device_type, 'ios')
+
+    def test_reregistering_updates_the_existing_token(self):
+        device_token = DeviceToken.objects.create(token=self.token, device_type='android', is_active=False)
+        user = User.objects.create_user('owner')
+
+        response = self.post(device_type='web', user_id=user.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], False)
+        self.assertEqual(response.json()['device_token_id'], device_token.id)
+
+        device_token.refresh_from_db()
+        self.assertEqual(
+            (device_token.device_type, device_token.user_id, device_token.is_active),
+            ('web', user.id, True)
+        )
+        self.assertEqual(DeviceToken.objects.count(), 1)
+
+    def test_user_id_is_linked(self):
+        user = User.objects.create_user('owner')
+        self.assertEqual(self.post(user_id=str(user.id)).status_code, 201)
+        self.assertEqual(DeviceToken.objects.get().user_id, user.id)
+
+    def test_unknown_user_is_not_found(self):
+        self.assertEqual(self.post(user_id=999).status_code, 404)
+        self.assertFalse(DeviceToken.objects.exists())
+
+    def test_invalid_user_ids_are_rejected(self):
+        User.objects.create_user('first')
+        for user_id in ['abc', True, [1], -1, 1.5]:
+            response = self.post(user_id=user_id)
+            self.assertEqual(response.status_code, 400, user_id)
+            self.assertEqual(response.json(), {'error': 'user_id must be an integer'})
+        self.assertFalse(DeviceToken.objects.exists())
+
+
+class SendTestNotificationTests(TestCase):
+    """The test endpoint queues the send instead of waiting on FCM"""
+
+    def post(self):
+        return self.client.post('/api/notifications/test/', {'token': 'a' * 40}, content_type='application/json')
+
+    @mock.patch('notifications.views.enqueue')
+    @mock.patch.object(FirebaseService, 'is_firebase_available', return_value=True)
+    def test_send_is_queued(self, is_firebase_available, enqueue):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'message': 'Test notification queued'})
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.args[1:3], ('a' * 40, 'Test Notification'))
+
+    @mock.patch('notifications.views.enqueue')
+    @mock.patch.object(FirebaseService, 'is_firebase_available', return_value=False)
+    def test_unconfigured_firebase_is_unavailable(self, is_firebase_available, enqueue):
+        self.assertEqual(self.post().status_code, 503)
+        enqueue.assert_not_called()
+
+
+class TestConnectionTests(TestCase):
+    """The pre-encoded connection check matches the old DRF response byte for byte"""
+
+    now = datetime.datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)
+
+    def test_body_matches_drf_renderer(self):
+        for firebase_available in [True, False]:
+            with mock.patch.object(FirebaseService, 'is_firebase_available', return_value=firebase_available), \
+                    mock.patch('django.utils.timezone.now', return_value=self.now):
+                response = self.client.get('/api/notifications/test-connection/')
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.content, JSONRenderer().render({
+                'message': 'Django backend is working!',
+                'timestamp': self.now.isoformat(),
+                'firebase_available': firebase_available,
+                'endpoints': views.ENDPOINTS
+            }))
+
+    def test_post_is_not_allowed(self):
+        self.assertEqual(self.client.post('/api/notifications/test-connection/').status_code, 405)
@@ -5,6 +5,7 @@ app_name = 'notifications'
 
 urlpatterns = [
     path('register/', views.register_device_token, name='register_device_token'),
+    path('register-bulk/', views.register_device_tokens_bulk, name='register_device_tokens_bulk'),
     path('unregister/', views.unregister_device_token, name='unregister_device_token'),
     path('test/', views.send_test_notification, name='send_test_notification'),
     path('mock-test/', views.mock_send_notification, name='mock_send_notification'),
@@ -2,14 +2,70 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.shortcuts import get_object_or_404
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
+from django.db import DatabaseError
+from django.utils import timezone
 from .models import DeviceToken, PushNotification
 from .firebase_service import FirebaseService
+from .signals import invalidate_target_tokens_cache, shared_cache_available, unregistered_token_key
+from .tasks import enqueue
+import hashlib
 import logging
+import orjson
+import re
 
 logger = logging.getLogger(__name__)
 
+# Endpoints listed by test_connection
+ENDPOINTS = {
+    'register': '/api/notifications/register/',
+    'register_bulk': '/api/notifications/register-bulk/',
+    'unregister': '/api/notifications/unregister/',
+    'test': '/api/notifications/test/',
+    'mock_test': '/api/notifications/mock-test/',
+    'connection_test': '/api/notifications/test-connection/'
+}
+
+# test_connection response body, split around the per-request timestamp
+_CONNECTION_BODY_START = b'{"message":"Django backend is working!","timestamp":"'
+_CONNECTION_BODY_FIREBASE_AVAILABLE = (
+    b'","firebase_available":true,"endpoints":' + orjson.dumps(ENDPOINTS) + b'}'
+)
+_CONNECTION_BODY_FIREBASE_UNAVAILABLE = (
+    b'","firebase_available":false,"endpoints":' + orjson.dumps(ENDPOINTS) + b'}'
+)
+
+# Largest primary key the database can store
+MAX_USER_ID = 2 ** 63 - 1
+
+# FCM registration tokens are URL-safe base64 with ':' separators
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_:\-]{32,4096}')
+
+
+def is_valid_token(token):
+    """Check a token looks like an FCM registration token before querying for it"""
+    return isinstance(token, str) and TOKEN_PATTERN.fullmatch(token) is not None
+
+
+def parse_user_id(value):
+    """
+    Convert a user id from a request payload to an int
+    
+    Returns None when no user is given and raises ValueError when the
+    value is not a positive integer or a string of digits.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= MAX_USER_ID:
+        raise ValueError(f"Invalid user id: {value!r}")
+    return value
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -25,9 +81,15 @@ def register_device_token(request):
     }
     """
     try:
-        token = request.data.get('token')
-        device_type = request.data.get('device_type', 'android')
-        user_id = request.data.get('user_id')
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Request body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        payload = request.data
+        token = payload.get('token')
+        device_type = payload.get('device_type', 'android')
         
         if not token:
             return Response(
@@ -35,35 +97,184 @@ def register_device_token(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get user if provided
-        user = None
-        if user_id:
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                return Response(
-                    {'error': 'User not found'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+        if not is_valid_token(token):
+            return Response(
+                {'error': 'Invalid token format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            user_id = parse_user_id(payload.get('user_id'))
+        except ValueError:
+            return Response(
+                {'error': 'user_id must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Create or update device token
-        device_token, created = DeviceToken.objects.update_or_create(
+        # Check the user exists if provided; only the id is needed for the FK
+        if user_id is not None and not User.objects.filter(id=user_id).exists():
+            return Response(
+                {'error': 'User not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        token_hash = DeviceToken.hash_token(token)
+        existing = DeviceToken.objects.filter(token_hash=token_hash).values_list(
+            'user_id', 'device_type', 'is_active'
+        ).first()
+        created = existing is None
+        
+        # Create or update the device token in one INSERT ... ON CONFLICT
+        device_token = DeviceToken(
             token=token,
-            defaults={
-                'user': user,
-                'device_type': device_type,
-                'is_active': True
-            }
+            token_hash=token_hash,
+            user_id=user_id,
+            device_type=device_type,
+            is_active=True
+        )
+        DeviceToken.objects.bulk_create(
+            [device_token],
+            update_conflicts=True,
+            unique_fields=['token_hash'],
+            update_fields=['user', 'device_type', 'is_active', 'updated_at']
         )
         
+        # bulk_create does not send post_save; a re-registration that changes
+        # nothing (the usual app launch) keeps the cached token lists
+        if existing != (user_id, device_type, True):
+            invalidate_target_tokens_cache()
+        cache.delete(unregistered_token_key(device_token.token_hash))
+        
         return Response({
             'message': 'Device token registered successfully',
             'created': created,
             'device_token_id': device_token.id
         }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         
-    except Exception as e:
-        logger.error(f"Error registering device token: {str(e)}")
+    except DatabaseError as e:
+        logger.error("Error registering device token: %s", e)
+        return Response(
+            {'error': 'Internal server error'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def register_device_tokens_bulk(request):
+    """
+    Register or update many device tokens in one request
+    
+    Expected payload:
+    {
+        "tokens": [
+            {
+                "token": "device_fcm_token",
+                "device_type": "android|ios|web",
+                "user_id": 1 (optional)
+            },
+            ...
+        ]
+    }
+    """
+    try:
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Request body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        entries = request.data.get('tokens')
+        
+        if not entries or not isinstance(entries, list):
+            return Response(
+                {'error': 'A non-empty list of tokens is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        max_tokens = getattr(settings, 'NOTIFICATION_BULK_REGISTER_MAX_TOKENS', 1000)
+        if len(entries) > max_tokens:
+            return Response(
+                {'error': f'At most {max_tokens} tokens can be registered per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not all(isinstance(entry, dict) and entry.get('token') for entry in entries):
+            return Response(
+                {'error': 'Token is required for every entry'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not all(is_valid_token(entry['token']) for entry in entries):
+            return Response(
+                {'error': 'Invalid token format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            user_ids = [parse_user_id(entry.get('user_id')) for entry in entries]
+        except ValueError:
+            return Response(
+                {'error': 'user_id must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Check all referenced users exist with one query
+        wanted_user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if wanted_user_ids:
+            found_user_ids = set(
+                User.objects.filter(id__in=wanted_user_ids).values_list('id', flat=True)
+            )
+            missing_user_ids = wanted_user_ids - found_user_ids
+            if missing_user_ids:
+                return Response(
+                    {'error': 'User not found', 'user_ids': sorted(missing_user_ids)},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        # One row per token; a later entry for the same token wins
+        device_tokens = {}
+        for entry, user_id in zip(entries, user_ids):
+            token_hash = DeviceToken.hash_token(entry['token'])
+            device_tokens[token_hash] = DeviceToken(
+                token=entry['token'],
+                token_hash=token_hash,
+                user_id=user_id,
+                device_type=entry.get('device_type', 'android'),
+                is_active=True
+            )
+        
+        existing = {
+            bytes(token_hash): (user_id, device_type, is_active)
+            for token_hash, user_id, device_type, is_active in DeviceToken.objects.filter(
+                token_hash__in=list(device_tokens)
+            ).values_list('token_hash', 'user_id', 'device_type', 'is_active')
+        }
+        changed = any(
+            existing.get(token_hash) != (device_token.user_id, device_token.device_type, True)
+            for token_hash, device_token in device_tokens.items()
+        )
+        
+        DeviceToken.objects.bulk_create(
+            list(device_tokens.values()),
+            update_conflicts=True,
+            unique_fields=['token_hash'],
+            update_fields=['user', 'device_type', 'is_active', 'updated_at'],
+            batch_size=1000
+        )
+        
+        # bulk_create does not send post_save
+        if changed:
+            invalidate_target_tokens_cache()
+        cache.delete_many([unregistered_token_key(token_hash) for token_hash in device_tokens])
+        
+        return Response({
+            'message': 'Device tokens registered successfully',
+            'count': len(device_tokens)
+        }, status=status.HTTP_200_OK)
+        
+    except DatabaseError as e:
+        logger.error("Error registering device tokens: %s", e)
         return Response(
             {'error': 'Internal server error'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -82,6 +293,12 @@ def unregister_device_token(request):
     }
     """
     try:
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Request body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         token = request.data.get('token')
         
         if not token:
@@ -90,27 +307,79 @@ def unregister_device_token(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        device_token = get_object_or_404(DeviceToken, token=token)
-        device_token.is_active = False
-        device_token.save()
+        if not is_valid_token(token):
+            return Response(
+                {'error': 'Invalid token format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        token_hash = DeviceToken.hash_token(token)
+        cache_key = unregistered_token_key(token_hash)
+        # A per-process cache would miss re-registrations made by other workers
+        use_cache = shared_cache_available()
+        
+        # Repeat unregisters of the same token are answered without a query
+        if use_cache and cache.get(cache_key):
+            return Response({
+                'message': 'Device token unregistered successfully'
+            }, status=status.HTTP_200_OK)
+        
+        # Deactivate in one UPDATE; already inactive tokens are not rewritten
+        updated = DeviceToken.objects.filter(token_hash=token_hash, is_active=True).update(
+            is_active=False,
+            updated_at=timezone.now()
+        )
+        
+        if not updated and not DeviceToken.objects.filter(token_hash=token_hash).exists():
+            return Response(
+                {'error': 'Device token not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if updated:
+            # update() does not send post_save
+            invalidate_target_tokens_cache()
+        
+        if use_cache:
+            cache.set(
+                cache_key,
+                True,
+                getattr(settings, 'NOTIFICATION_UNREGISTERED_CACHE_TIMEOUT', 60)
+            )
         
         return Response({
             'message': 'Device token unregistered successfully'
         }, status=status.HTTP_200_OK)
         
-    except Exception as e:
-        logger.error(f"Error unregistering device token: {str(e)}")
+    except DatabaseError as e:
+        logger.error("Error unregistering device token: %s", e)
         return Response(
             {'error': 'Internal server error'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+def _send_test_notification(token, title, body, data, image_url):
+    """Send a queued test notification and log the outcome"""
+    response = FirebaseService.send_notification_to_token(
+        token=token,
+        title=title,
+        body=body,
+        data=data,
+        image_url=image_url
+    )
+    
+    if response['success']:
+        logger.info("Test notification sent successfully: %s", response['message_id'])
+    else:
+        logger.error("Failed to send test notification: %s", response['error'])
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def send_test_notification(request):
     """
-    Send a test notification to a specific device token
+    Queue a test notification to a specific device token
     
     Expected payload:
     {
@@ -122,16 +391,23 @@ def send_test_notification(request):
     }
     """
     try:
-        token = request.data.get('token')
-        title = request.data.get('title', 'Test Notification')
-        body = request.data.get('body', 'This is a test notification')
-        data = request.data.get('data', {})
-        image_url = request.data.get('image_url')
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Request body must be a JSON object'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        payload = request.data
+        token = payload.get('token')
+        title = payload.get('title', 'Test Notification')
+        body = payload.get('body', 'This is a test notification')
+        data = payload.get('data', {})
+        image_url = payload.get('image_url')
         
-        logger.info(f"Test notification request received:")
-        logger.info(f"Token: {token[:20] if token else 'None'}...")
-        logger.info(f"Title: {title}")
-        logger.info(f"Body: {body}")
+        logger.info(
+            "Test notification request received: token=%s... title=%s body=%s",
+            str(token)[:20] if token else 'None', title, body
+        )
         
         if not token:
             return Response(
@@ -139,6 +415,12 @@ def send_test_notification(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if not is_valid_token(token):
+            return Response(
+                {'error': 'Invalid token format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Check if Firebase is available
         if not FirebaseService.is_firebase_available():
             return Response({
@@ -146,29 +428,16 @@ def send_test_notification(request):
                 'details': 'Download the service account key from Firebase Console and place it in the project root'
             }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         
-        # Send notification
-        response = FirebaseService.send_notification_to_token(
-            token=token,
-            title=title,
-            body=body,
-            data=data,
-            image_url=image_url
-        )
+        # Send on the worker pool so the request does not wait on FCM
+        enqueue(_send_test_notification, token, title, body, data, image_url)
         
-        if response['success']:
-            logger.info(f"Test notification sent successfully: {response['message_id']}")
-            return Response({
-                'message': 'Test notification sent successfully',
-                'message_id': response['message_id']
-            }, status=status.HTTP_200_OK)
-        else:
-            logger.error(f"Failed to send test notification: {response['error']}")
-            return Response({
-                'error': f'Failed to send notification: {response["error"]}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-    except Exception as e:
-        logger.error(f"Error sending test notification: {str(e)}")
+        return Response({
+            'message': 'Test notification queued'
+        }, status=status.HTTP_202_ACCEPTED)
+        
+    except (ValueError, OSError) as e:
+        # Raised when the service account key cannot be loaded
+        logger.error("Error sending test notification: %s", e)
         return Response(
             {
                 'error': 'Internal server error', 
@@ -178,33 +447,32 @@ def send_test_notification(request):
         )
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
+@require_safe
 def test_connection(request):
     """
     Simple test endpoint to verify Django backend is working
+    
+    Served as a plain Django view from pre-encoded JSON since it is polled
+    by uptime checks; only the timestamp is encoded per request.
     """
     try:
-        from django.utils import timezone
-        
-        return Response({
-            'message': 'Django backend is working!',
-            'timestamp': timezone.now().isoformat(),
-            'firebase_available': FirebaseService.is_firebase_available(),
-            'endpoints': {
-                'register': '/api/notifications/register/',
-                'unregister': '/api/notifications/unregister/',
-                'test': '/api/notifications/test/',
-                'mock_test': '/api/notifications/mock-test/',
-                'connection_test': '/api/notifications/test-connection/'
-            }
-        }, status=status.HTTP_200_OK)
+        firebase_available = FirebaseService.is_firebase_available()
         
-    except Exception as e:
-        return Response({
+    except (ValueError, OSError) as e:
+        return JsonResponse({
             'error': 'Backend error',
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    if firebase_available:
+        body_end = _CONNECTION_BODY_FIREBASE_AVAILABLE
+    else:
+        body_end = _CONNECTION_BODY_FIREBASE_UNAVAILABLE
+    
+    return HttpResponse(
+        _CONNECTION_BODY_START + timezone.now().isoformat().encode() + body_end,
+        content_type='application/json'
+    )
 
 
 @api_view(['POST'])
@@ -213,34 +481,45 @@ def mock_send_notification(request):
     """
     Mock notification sending for testing without Firebase
     """
-    try:
-        token = request.data.get('token')
-        title = request.data.get('title', 'Test Notification')
-        body = request.data.get('body', 'This is a test notification')
-        
-        logger.info(f"Mock notification request:")
-        logger.info(f"Token: {token[:20] if token else 'None'}...")
-        logger.info(f"Title: {title}")
-        logger.info(f"Body: {body}")
-        
-        if not token:
-            return Response(
-                {'error': 'Token is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Simulate successful notification
-        mock_message_id = f"mock-message-{hash(token + title + body)}"
-        
-        return Response({
-            'message': 'Mock notification sent successfully (Firebase not configured)',
-            'message_id': mock_message_id,
-            'note': 'This is a mock response. To send real notifications, configure Firebase.'
-        }, status=status.HTTP_200_OK)
-        
-    except Exception as e:
-        logger.error(f"Error in mock notification: {str(e)}")
+    if not isinstance(request.data, dict):
         return Response(
-            {'error': 'Internal server error', 'details': str(e)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': 'Request body must be a JSON object'},
+            status=status.HTTP_400_BAD_REQUEST
         )
+    
+    payload = request.data
+    token = payload.get('token')
+    title = payload.get('title', 'Test Notification')
+    body = payload.get('body', 'This is a test notification')
+    
+    logger.info(
+        "Mock notification request: token=%s... title=%s body=%s",
+        str(token)[:20] if token else 'None', title, body
+    )
+    
+    if not token:
+        return Response(
+            {'error': 'Token is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not all(isinstance(value, str) for value in (token, title, body)):
+        return Response(
+            {'error': 'Token, title and body must be strings'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Simulate successful notification with an id that is stable across processes
+    message_hash = hashlib.blake2b(digest_size=8)
+    message_hash.update(token.encode())
+    message_hash.update(b'|')
+    message_hash.update(title.encode())
+    message_hash.update(b'|')
+    message_hash.update(body.encode())
+    mock_message_id = f"mock-message-{message_hash.hexdigest()}"
+    
+    return Response({
+        'message': 'Mock notification sent successfully (Firebase not configured)',
+        'message_id': mock_message_id,
+        'note': 'This is a mock response. To send real notifications, configure Firebase.'
+    }, status=status.HTTP_200_OK)
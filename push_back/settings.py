@@ -80,6 +80,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse each thread's connection across requests instead of reconnecting
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -140,6 +143,30 @@ CORS_ALLOW_ALL_ORIGINS = True  # Only for development, set to False in productio
 # Download this from Firebase Console -> Project Settings -> Service Accounts -> Generate new private key
 FIREBASE_SERVICE_ACCOUNT_KEY = BASE_DIR / 'firebase-service-account-key.json'
 
+# Number of NotificationLog rows written per INSERT when logging a send
+NOTIFICATION_LOG_BULK_BATCH = 500
+
+# Largest number of tokens accepted by one bulk registration request
+NOTIFICATION_BULK_REGISTER_MAX_TOKENS = 1000
+
+# Number of background threads used to send auto-sent notifications
+NOTIFICATION_SEND_WORKERS = 4
+
+# Token lists for an audience are cached for reuse by later sends;
+# audiences larger than the row limit are always streamed from the database.
+# Requires a CACHES backend shared by all processes (e.g. Redis or Memcached);
+# with the default local-memory cache token lists are never cached
+NOTIFICATION_TOKEN_CACHE_TIMEOUT = 3600
+NOTIFICATION_TOKEN_CACHE_MAX_ROWS = 10000
+
+# How long a repeat unregister of the same token is answered from the cache;
+# like the token lists above, only used with a shared CACHES backend
+NOTIFICATION_UNREGISTERED_CACHE_TIMEOUT = 60
+
+# Keep-alive HTTPS connections held open to FCM; multicast sends run one
+# request per token in parallel, so this bounds how many reuse a connection
+FIREBASE_HTTP_POOL_SIZE = 50
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -148,6 +175,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'notifications.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ]
 }
 